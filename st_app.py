@@ -1,18 +1,44 @@
-import os, time, socket, ssl, traceback
+import os, re, time, socket, ssl, queue, types, threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import pyarrow as pa
 import streamlit as st
 
-# try to import hdbcli
-try:
-    from hdbcli import dbapi
-except Exception:
-    dbapi = None
-
 st.set_page_config(page_title="Retail - HANA direct (view only)", layout="wide")
 
 SCHEMA = os.environ.get("HANA_SCHEMA", "SMART_RETAIL1")
+if not re.fullmatch(r"[A-Z0-9_]+", SCHEMA):
+    # SCHEMA is interpolated into the SQL constants below, so reject anything but a plain identifier
+    st.error(f"Invalid HANA_SCHEMA: {SCHEMA!r}")
+    st.stop()
+PAGE_SIZE = 200
+POOL_SIZE = int(os.environ.get("HANA_POOL_SIZE", 8))
+if POOL_SIZE < 1:
+    # LifoQueue(maxsize<=0) is unbounded, which would defeat the connection cap
+    st.error(f"Invalid HANA_POOL_SIZE: {POOL_SIZE} (must be at least 1)")
+    st.stop()
+POOL_MIN = int(os.environ.get("HANA_POOL_MIN", 1))
+# hdbcli error codes for a connection that is gone: connection failed / lost / session not connected
+HANA_DISCONNECT_CODES = (-10709, -10807, -10821)
+# "session has been reconnected": reconnect=True already restored the session on the same connection
+HANA_SESSION_RECONNECTED = -10108
+POOL_PREWARM = os.environ.get("HANA_NO_PREWARM", "false").lower() not in ("1","true","yes")
+POOL_PREWARM_WAIT_SECONDS = 30
+
+PRODUCT_COLUMNS = ("PRODUCT_ID", "NAME", "DESCRIPTION")
+SQL_SELECT_PRODUCTS = (
+    f'SELECT PRODUCT_ID, NAME, DESCRIPTION FROM "{SCHEMA}"."PRODUCT_EMBEDDINGS" '
+    # PRODUCT_ID is not unique, so order on every column to keep tied rows from moving between pages
+    'ORDER BY PRODUCT_ID, NAME, DESCRIPTION LIMIT ? OFFSET ?'
+)
 
 # ---------- config ----------
+@st.cache_resource
 def read_hana_config():
+    # parsed once per process; frozen because the cached object is shared by all sessions
+    return types.MappingProxyType(_build_hana_config())
+
+def _build_hana_config():
     try:
         if st.secrets and "hana" in st.secrets:
             h = st.secrets["hana"]
@@ -38,26 +64,77 @@ def read_hana_config():
 hana_cfg = read_hana_config()
 
 # ---------- connection ----------
-def tcp_check(host, port, timeout=5):
+@st.cache_resource
+def _tls_context():
+    # loading the CA store is the expensive part of create_default_context(); do it once
+    return ssl.create_default_context()
+
+DNS_CACHE_SECONDS = 30
+
+@st.cache_resource
+def _dns_cache():
+    # (host, port) -> (expires_at, addrs), shared by probe worker threads, hence the lock
+    return {}, threading.Lock()
+
+def _resolve(host, port, cache=None):
+    key = (host, port)
+    if cache is not None:
+        entries, lock = cache
+        with lock:
+            hit = entries.get(key)
+        if hit and hit[0] > time.monotonic():
+            return hit[1]
+    # keep every address, in resolver order, so a probe can fall through e.g. an unreachable AAAA record
+    addrs = tuple(dict.fromkeys(ai[4][0] for ai in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)))
+    if cache is not None:
+        with lock:
+            entries[key] = (time.monotonic() + DNS_CACHE_SECONDS, addrs)
+    return addrs
+
+def _tcp_connect(addrs, port, timeout):
+    # like socket.create_connection: try each resolved address in turn, raise the last error
+    last_exc = None
+    for ip in addrs:
+        try:
+            return socket.create_connection((ip, port), timeout=timeout)
+        except Exception as e:
+            last_exc = e
+    raise last_exc
+
+def net_check(host, port, timeout=5, ctx=None, dns_cache=None):
+    # one socket for both checks: TCP connect, then the TLS handshake on top of it.
+    # Runs on a worker thread, so the DNS lookup overlaps the products fetch too.
+    skipped = (False, "skipped (no TCP connection)")
+    if not host:
+        return (False, "no HANA host configured"), skipped  # resolving None would probe loopback
+    try:
+        addrs = _resolve(host, port, dns_cache)
+    except OSError as e:
+        return (False, f"DNS lookup failed: {e}"), skipped
     try:
-        s = socket.create_connection((host, port), timeout=timeout)
-        s.close()
-        return True, "TCP ok"
+        raw = _tcp_connect(addrs, port, timeout)
     except Exception as e:
-        return False, str(e)
-
-def tls_check(host, port, timeout=5):
+        return (False, str(e)), skipped
     try:
-        raw = socket.create_connection((host, port), timeout=timeout)
-        ctx = ssl.create_default_context()
-        ss = ctx.wrap_socket(raw, server_hostname=host)
+        ss = (ctx or ssl.create_default_context()).wrap_socket(raw, server_hostname=host)
         _ = ss.cipher()
         ss.close()
-        return True, "TLS ok"
+        return (True, "TCP ok"), (True, "TLS ok")
     except Exception as e:
-        return False, str(e)
+        raw.close()
+        return (True, "TCP ok"), (False, str(e))
+
+@st.cache_resource
+def _dbapi():
+    # imported on first connect, so the page renders before hdbcli's native library is loaded
+    try:
+        from hdbcli import dbapi
+    except Exception:
+        return None
+    return dbapi
 
-def get_hana_connection():
+def _connect(dbapi=None):
+    dbapi = dbapi or _dbapi()
     if dbapi is None:
         raise RuntimeError("hdbcli not installed")
     return dbapi.connect(
@@ -67,34 +144,169 @@ def get_hana_connection():
         password=hana_cfg.get("password"),
         encrypt=hana_cfg.get("encrypt", True),
         sslValidateCertificate=hana_cfg.get("sslValidateCertificate", False),
+        communicationTimeout=30000,
+        reconnect=True,
     )
 
+def _prewarm(pool, dbapi, count, ready):
+    # ready is set once the first connection is pooled (or prewarming gave up), so the first
+    # checkout can wait for it instead of opening a second connection of its own
+    try:
+        for _ in range(count):
+            try:
+                conn = _connect(dbapi)
+            except Exception:
+                return  # the first real checkout connects again and surfaces the error
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1 FROM DUMMY")
+                cur.fetchall()
+                cur.close()
+            except Exception:
+                conn.close()
+                return
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+                return
+            ready.set()
+    finally:
+        ready.set()
+
+@st.cache_resource
+def _hana_pool():
+    # LIFO so the most recently used (warmest) connection is handed out first
+    pool = queue.LifoQueue(maxsize=POOL_SIZE)
+    prewarmed = threading.Event()
+    dbapi = _dbapi()
+    if POOL_PREWARM and dbapi is not None and POOL_MIN > 0:
+        threading.Thread(
+            target=_prewarm, args=(pool, dbapi, min(POOL_MIN, POOL_SIZE), prewarmed), daemon=True,
+        ).start()
+    else:
+        prewarmed.set()
+    return pool, prewarmed
+
+def _is_disconnect(e):
+    return getattr(e, "errorcode", None) in HANA_DISCONNECT_CODES
+
+@contextmanager
+def pooled_conn():
+    # yields (conn, reused); reused is True only for a connection that came out of the pool as-is
+    pool, prewarmed = _hana_pool()
+    # while prewarm is still connecting, wait for its connection rather than opening another one
+    prewarmed.wait(POOL_PREWARM_WAIT_SECONDS)
+    reused = False
+    try:
+        conn = pool.get_nowait()
+        if conn.isconnected():
+            reused = True
+        else:
+            try:
+                conn.close()  # release the dead handle's native resources before replacing it
+            except Exception:
+                pass
+            conn = _connect()
+    except queue.Empty:
+        conn = _connect()
+    broken = False
+    try:
+        yield conn, reused
+    except Exception as e:
+        broken = _is_disconnect(e)
+        raise
+    finally:
+        if broken:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        else:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+@contextmanager
+def hana_cursor(conn):
+    cur = conn.cursor()
+    try:
+        yield cur
+    finally:
+        cur.close()
+
+# ---------- data ----------
+def _select_page(conn, page):
+    params = (PAGE_SIZE, (page - 1) * PAGE_SIZE)
+    for attempt in (1, 2):
+        try:
+            with hana_cursor(conn) as cur:
+                cur.arraysize = PAGE_SIZE
+                cur.execute(SQL_SELECT_PRODUCTS, params)
+                return [tuple(r) for r in cur.fetchmany()]
+        except Exception as e:
+            # reconnect=True has already restored the session: rerun on the same connection
+            if attempt == 2 or getattr(e, "errorcode", None) != HANA_SESSION_RECONNECTED:
+                raise
+
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_products(page=1):
+    # no ping before use: if a reused pooled connection turns out to be dead, pooled_conn drops it
+    # and the query is retried once on another one. Failures to open a connection are not retried.
+    reused = False
+    try:
+        with pooled_conn() as (conn, reused):
+            return _select_page(conn, page)
+    except Exception as e:
+        if not (reused and _is_disconnect(e)):
+            raise
+    with pooled_conn() as (conn, _):
+        return _select_page(conn, page)
+
 # ---------- UI ----------
 st.title("Retail - HANA direct (print table)")
+_hana_pool()  # after the first paint: prewarm overlaps the rest of the page; the first fetch waits for it
 
+net_future = None
 with st.expander("Diagnostics (non-sensitive)"):
     st.write("Local timestamp:", time.strftime("%Y-%m-%d %H:%M:%S"))
     st.write("HANA host:", hana_cfg.get("address"))
     st.write("HANA port:", hana_cfg.get("port"))
-    ok, msg = tcp_check(hana_cfg.get("address"), hana_cfg.get("port"))
-    st.write("TCP:", msg if ok else f"Failed: {msg}")
-    ok, msg = tls_check(hana_cfg.get("address"), hana_cfg.get("port"))
-    st.write("TLS:", msg if ok else f"Failed: {msg}")
-    st.write("hdbcli installed:", bool(dbapi))
+    if st.button("Run network checks"):
+        # probe in the background while the products page below is fetched; results are filled in at the end
+        net_checked_at = time.strftime("%H:%M:%S")
+        net_executor = ThreadPoolExecutor(max_workers=1)
+        net_future = net_executor.submit(
+            net_check, hana_cfg.get("address"), hana_cfg.get("port"),
+            ctx=_tls_context(), dns_cache=_dns_cache(),
+        )
+        net_executor.shutdown(wait=False)
+    net_box = st.container()
+    st.write("hdbcli installed:", _dbapi() is not None)
 
 st.header("Products table")
+page = st.number_input("Page", min_value=1, value=1, step=1)
+if st.button("Refresh table"):
+    fetch_products.clear()
 try:
-    conn = get_hana_connection()
-    cur = conn.cursor()
-    cur.execute(f'SELECT PRODUCT_ID, NAME, DESCRIPTION FROM "{SCHEMA}"."PRODUCT_EMBEDDINGS" ORDER BY PRODUCT_ID')
-    rows = cur.fetchall()
-    cur.close(); conn.close()
+    rows = fetch_products(int(page))
 
-    if not rows:
+    if not rows and page > 1:
+        st.info(f"No rows on page {int(page)}; the table has fewer pages.")
+    elif not rows:
         st.info("No rows found in PRODUCT_EMBEDDINGS.")
     else:
-        st.dataframe([{"PRODUCT_ID": r[0], "NAME": r[1], "DESCRIPTION": r[2]} for r in rows])
+        st.dataframe(pa.table(dict(zip(PRODUCT_COLUMNS, zip(*rows)))))
 
 except Exception as e:
     st.error("❌ Failed to fetch rows from HANA.")
     st.exception(e)
+
+if net_future is not None:
+    # keep the last result, with when it ran, so later reruns in this session show it without probing again
+    st.session_state["net_check"] = (net_checked_at, net_future.result())
+if "net_check" in st.session_state:
+    checked_at, ((tcp_ok, tcp_msg), (tls_ok, tls_msg)) = st.session_state["net_check"]
+    net_box.write(f"TCP (checked {checked_at}):", tcp_msg if tcp_ok else f"Failed: {tcp_msg}")
+    net_box.write(f"TLS (checked {checked_at}):", tls_msg if tls_ok else f"Failed: {tls_msg}")